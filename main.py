@@ -1,120 +1,571 @@
 import os
+import sys
+import logging
+import asyncio
+import hashlib
+import copy
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from pathlib import Path
 from typing import TypedDict
+import google.auth
+import httpx
+import orjson
+import openai
+from google.api_core import exceptions as google_exceptions
+from tenacity import (
+    before_sleep_log, retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+)
 from dotenv import load_dotenv
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
 
 # LangChain / LangGraph imports
 from langgraph.graph import StateGraph, END
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langchain_google_vertexai import ChatVertexAI
 from langchain_openai import AzureChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
 
 # Load environment variables from a .env file if you have one
 load_dotenv()
 
+# Progress goes through logging; only the spec, streamed tokens and final tickets are printed
+logger = logging.getLogger(__name__)
+
 # --- CONFIGURATION ---
-# 1. Google Cloud (The "Reader" Brain)
-# We use Gemini 1.5 Pro because it has a massive context window (1M+ tokens),
-# perfect for reading huge requirements documents.
+# 1. Google Cloud (The "Reader" Brain, SPLIT_PROMPT=true only)
+# In the two-step chain, Gemini 1.5 Pro reads the spec first because it has a massive
+# context window (1M+ tokens), perfect for reading huge requirements documents.
+# The default single-call path doesn't use Gemini at all (see THE GRAPH below).
 # Ensure you run `gcloud auth application-default login` in your terminal first.
+# The client is built lazily on first use (so importing this module needs no GCP
+# access) and cached, with credentials resolved once up front via google.auth.
 GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID", "your-google-cloud-project-id")
-gemini_model = ChatVertexAI(
-    model_name="gemini-1.5-pro",
-    temperature=0,
-    max_output_tokens=2048,
-    project=GCP_PROJECT_ID
-)
+GCP_LOCATION = os.getenv("GCP_LOCATION", "us-central1")
+
+@lru_cache(maxsize=1)
+def get_gemini() -> ChatVertexAI:
+    credentials, _ = google.auth.default()
+    return ChatVertexAI(
+        model_name="gemini-1.5-pro",
+        temperature=0,
+        max_output_tokens=2048,
+        project=GCP_PROJECT_ID,
+        location=GCP_LOCATION,
+        credentials=credentials,
+        max_retries=0  # call_llm/stream_llm own the retry policy
+    )
 
 # 2. Azure OpenAI (The "Writer" Brain)
-# We use GPT-4 on Azure to format the output. This simulates a common enterprise
+# We use GPT-4 on Azure to produce the output. This simulates a common enterprise
 # constraint where final artifacts must be generated by a specific compliant provider.
+# By default it also does the gap analysis, in the same call as the tickets.
 # If you don't have Azure keys yet, you can swap this class for standard `ChatOpenAI`.
-azure_model = AzureChatOpenAI(
-    azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4"),
-    openai_api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT", "https://your-org.openai.azure.com/"),
-    api_key=os.getenv("AZURE_OPENAI_API_KEY")
+# All Azure calls share one pooled HTTP/2 client, so concurrent requests multiplex
+# over warm connections instead of each paying for a new TLS handshake.
+@lru_cache(maxsize=1)
+def get_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        timeout=httpx.Timeout(60.0)
+    )
+
+@lru_cache(maxsize=1)
+def get_azure() -> AzureChatOpenAI:
+    return AzureChatOpenAI(
+        azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4"),
+        openai_api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview"),
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT", "https://your-org.openai.azure.com/"),
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        http_async_client=get_http_client(),
+        max_retries=0  # call_llm/stream_llm own the retry policy
+    )
+
+async def close_clients():
+    """
+    Close the shared HTTP client. Call this before the event loop that used it shuts down.
+    The cached client, both models and the LLM semaphore are dropped, so a later event
+    loop gets fresh ones instead of objects bound to a closed loop (ChatVertexAI keeps
+    the async gRPC client it built on its first ainvoke).
+    """
+    if get_http_client.cache_info().currsize:
+        await get_http_client().aclose()
+    get_gemini.cache_clear()
+    get_azure.cache_clear()
+    get_http_client.cache_clear()
+    get_llm_semaphore.cache_clear()
+
+# 3. Resilience
+# Provider latency is fat-tailed, so every LLM call gets a timeout, jittered
+# exponential-backoff retries on transient errors, and a shared concurrency cap
+# so batch runs don't hammer either provider.
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", "16"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+
+# Like the HTTP client, an asyncio.Semaphore binds to the event loop that first
+# waits on it, so it is built lazily and dropped again by close_clients().
+@lru_cache(maxsize=1)
+def get_llm_semaphore() -> asyncio.Semaphore:
+    return asyncio.Semaphore(MAX_CONCURRENCY)
+
+TRANSIENT_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
 )
 
+log_retry = before_sleep_log(logger, logging.WARNING)
+
+def llm_retry(before_sleep=log_retry):
+    return retry(
+        wait=wait_random_exponential(multiplier=1, max=30),
+        stop=stop_after_attempt(5),
+        retry=retry_if_exception_type(TRANSIENT_ERRORS),
+        before_sleep=before_sleep,
+        reraise=True
+    )
+
+def log_stream_retry(retry_state):
+    """
+    A streamed reply that fails partway has already been echoed in part. Mark the
+    restart so the retried reply isn't read as a continuation of the truncated one.
+    Failures before the first echoed token (e.g. a 429 on the request) need no marker.
+    """
+    progress = retry_state.kwargs["progress"]
+    if progress["echoed"]:
+        print("\n[... stream interrupted, retrying; the reply restarts below ...]", flush=True)
+        progress["echoed"] = False
+    log_retry(retry_state)
+
+@llm_retry()
+async def call_llm(model, messages):
+    async with get_llm_semaphore():
+        return await asyncio.wait_for(model.ainvoke(messages), timeout=LLM_TIMEOUT)
+
+@llm_retry(before_sleep=log_stream_retry)
+async def _stream_attempt(model, messages, *, echo: bool, progress: dict) -> str:
+    async def collect() -> str:
+        chunks = []
+        async for chunk in model.astream(messages):
+            if echo:
+                print(chunk.content, end="", flush=True)
+                progress["echoed"] = True
+            chunks.append(chunk.content)
+        if echo:
+            print()
+        return "".join(chunks)
+
+    async with get_llm_semaphore():
+        return await asyncio.wait_for(collect(), timeout=LLM_TIMEOUT)
+
+async def stream_llm(model, messages, *, echo: bool = False) -> str:
+    """
+    Like call_llm, but streams the reply (echoing it if asked) and returns the full text.
+    """
+    return await _stream_attempt(model, messages, echo=echo, progress={"echoed": False})
+
+# The writer is asked for raw JSON but often wraps it in a ```json fence anyway.
+def strip_fences(text: str) -> str:
+    """
+    Remove a leading ``` / ```json fence and a trailing ``` fence, if present.
+    Only looks at the two ends with plain str methods, so it is linear in the
+    output size and can't backtrack the way a regex over the whole payload can.
+    """
+    text = text.strip()
+    start, end = 0, len(text)
+    if text.startswith("```"):
+        start = 3
+        if text.startswith("json", start):
+            start += 4
+    if text.endswith("```") and end - 3 >= start:
+        end -= 3
+    return text[start:end].strip()
+
+def parse_json(text: str, brackets: str = "[]"):
+    """
+    Parse the writer's JSON output with orjson. If the model wrapped the list (or,
+    with brackets="{}", the object) in extra prose, retry on the outermost bracketed
+    slice. Returns None if both fail.
+    """
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        pass
+    start, end = text.find(brackets[0]), text.rfind(brackets[1])
+    if start == -1 or end < start:
+        return None
+    try:
+        return orjson.loads(text[start:end + 1])
+    except orjson.JSONDecodeError:
+        return None
+
+class JiraTicket(BaseModel):
+    """
+    One drafted ticket, in the shape the writer prompt asks for. Extra fields the
+    model adds are kept, so parsed_tickets stays in step with jira_tickets.
+    """
+    model_config = ConfigDict(extra="allow")
+
+    title: str = Field(alias="Title")
+    user_story: str = Field(alias="User Story")
+    acceptance_criteria: str | list[str] = Field(alias="Acceptance Criteria")
+
+_TICKETS_ADAPTER = TypeAdapter(list[JiraTicket])
+
+def validate_tickets(tickets) -> list[dict] | None:
+    """
+    Check parsed tickets against JiraTicket so malformed output is caught here
+    rather than by whoever consumes it. Returns None (raw-text fallback) if invalid.
+    Also accepts a list wrapped in a one-key object ({"tickets": [...]}) or a single
+    ticket object, both common replies to "format them as JSON".
+    """
+    if tickets is None:
+        return None
+    if isinstance(tickets, dict):
+        if len(tickets) == 1 and isinstance(next(iter(tickets.values())), list):
+            tickets = next(iter(tickets.values()))
+        else:
+            tickets = [tickets]
+    try:
+        items = _TICKETS_ADAPTER.validate_python(tickets)
+    except ValidationError as exc:
+        logger.warning("Drafted tickets failed validation: %s", exc)
+        return None
+    return [item.model_dump(by_alias=True) for item in items]
+
 # --- THE AGENT STATE ---
 # In LangGraph, "State" is the shared memory that passes between steps.
 # It works like a dictionary that gets updated as the agent moves through the graph.
 class AgentState(TypedDict):
     spec_text: str      # Input: The raw requirement text
-    analysis_gaps: str  # Intermediate: The gaps found by Gemini
+    analysis_gaps: str  # Intermediate: The gaps found by Azure (or by Gemini with SPLIT_PROMPT=true)
     jira_tickets: str   # Output: The final tickets formatted by Azure
+    parsed_tickets: list[dict] | None  # Output: jira_tickets parsed and validated once (None if invalid)
 
-# --- NODES (The Steps) ---
+# --- PROMPTS ---
+# Built once at import and filled with str.format.
 
-def analyze_requirements_node(state: AgentState):
-    """
-    Step 1: Use Google Gemini to analyze the spec for missing details.
-    """
-    print("--- STEP 1: Google Gemini is analyzing the requirements... ---")
-    
-    spec = state['spec_text']
-    
-    prompt = f"""
+ANALYZE_TMPL = """
     You are a Senior Solutions Architect. Analyze the following project requirement text.
     Identify technical gaps, missing acceptance criteria, and vague statements.
     
     REQUIREMENT TEXT:
-    {spec}
+    {spec_text}
     """
-    
-    # Invoke Gemini
-    response = gemini_model.invoke([HumanMessage(content=prompt)])
-    
-    # Update the state with the analysis
-    return {"analysis_gaps": response.content}
 
-def draft_tickets_node(state: AgentState):
-    """
-    Step 2: Use Azure OpenAI to take the analysis and write Jira tickets.
-    """
-    print("--- STEP 2: Azure OpenAI is drafting Jira tickets... ---")
-    
-    analysis = state['analysis_gaps']
-    original_spec = state['spec_text']
-    
-    prompt = f"""
+DRAFT_TMPL = """
     You are a Technical Product Owner. 
     Based on the original request and the Architect's gap analysis below, 
     write 3 structured Jira tickets.
     
-    Format them strictly as JSON with fields: 'Title', 'User Story', 'Acceptance Criteria'.
+    Format them strictly as a JSON array of objects with fields: 'Title', 'User Story', 'Acceptance Criteria'.
     
     ORIGINAL REQUEST:
-    {original_spec}
+    {spec_text}
     
     ARCHITECT'S ANALYSIS:
     {analysis}
     """
+
+# Single-call variant: the writer does the gap analysis and the tickets in one reply,
+# saving a full cross-provider round trip per spec.
+ANALYZE_AND_DRAFT_TMPL = """
+    You are a Senior Solutions Architect acting as Technical Product Owner.
+    First analyze the following project requirement text: identify technical gaps,
+    missing acceptance criteria, and vague statements.
+    Then, based on that analysis, write 3 structured Jira tickets.
     
-    # Invoke Azure OpenAI
-    response = azure_model.invoke([HumanMessage(content=prompt)])
+    Respond strictly as a JSON object of the form
+    {{"analysis": "<your gap analysis>", "tickets": [...]}}
+    where each ticket has fields: 'Title', 'User Story', 'Acceptance Criteria'.
     
-    # Update the state with the final tickets
-    return {"jira_tickets": response.content}
+    REQUIREMENT TEXT:
+    {spec_text}
+    """
+
+def tickets_update(raw_output: str) -> dict:
+    """
+    Strip any markdown fence from the writer's output, then parse and validate it once.
+    """
+    tickets_json = strip_fences(raw_output)
+    return {
+        "jira_tickets": tickets_json,
+        "parsed_tickets": validate_tickets(parse_json(tickets_json))
+    }
+
+def analyze_and_draft_update(raw_output: str) -> dict:
+    """
+    Split the single-call reply into analysis and tickets with one parse.
+    If it isn't the expected JSON object, keep the raw text as the tickets.
+    """
+    cleaned = strip_fences(raw_output)
+    reply = parse_json(cleaned, "{}")
+    if not isinstance(reply, dict) or not isinstance(reply.get("tickets"), list):
+        return {"analysis_gaps": "", "jira_tickets": cleaned, "parsed_tickets": None}
+    # The model sometimes returns the analysis as structured JSON rather than prose
+    analysis = reply.get("analysis")
+    if analysis is None:
+        analysis = ""
+    elif not isinstance(analysis, str):
+        analysis = orjson.dumps(analysis, option=orjson.OPT_INDENT_2).decode()
+    return {
+        "analysis_gaps": analysis,
+        "jira_tickets": orjson.dumps(reply["tickets"]).decode(),
+        "parsed_tickets": validate_tickets(reply["tickets"])
+    }
+
+# --- RESPONSE CACHE ---
+# Identical step inputs (the same spec run twice in a long-lived process, or two
+# concurrent runs that reach the same step) would otherwise pay for identical LLM
+# calls. Concurrent duplicates share the one call already in flight, and finished
+# results are kept in a small LRU with a short TTL, keyed on hashes of the prompt
+# inputs. Only usable results are cached, so a malformed draft is asked for again.
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "128"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "900"))
+_CACHE: OrderedDict[tuple, tuple[float, object]] = OrderedDict()
+_INFLIGHT: dict[tuple, asyncio.Task] = {}
+
+def digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+def cache_get(key: tuple):
+    entry = _CACHE.get(key)
+    if entry is None:
+        return None
+    stored_at, result = entry
+    if time.monotonic() - stored_at > LLM_CACHE_TTL:
+        del _CACHE[key]
+        return None
+    _CACHE.move_to_end(key)
+    logger.debug("LLM cache hit for %s", key[0])
+    return result
+
+def cache_put(key: tuple, result):
+    _CACHE[key] = (time.monotonic(), result)
+    _CACHE.move_to_end(key)
+    while len(_CACHE) > LLM_CACHE_SIZE:
+        _CACHE.popitem(last=False)
+
+def _settle(key: tuple, task: asyncio.Task, keep):
+    _INFLIGHT.pop(key, None)
+    if task.cancelled() or task.exception() is not None:
+        return
+    if keep(task.result()):
+        cache_put(key, task.result())
+
+async def cached(key: tuple, fetch, keep) -> tuple[object, bool]:
+    """
+    Return (result, fetched) for key: from the cache, by joining an identical call
+    already in flight, or by running fetch(). `fetched` is True only for the caller
+    that ran fetch(). Results are cached only if keep(result) is true. Every caller
+    gets its own copy, so mutating a result can't change the cache or other runs.
+    """
+    result = cache_get(key)
+    if result is not None:
+        return copy.deepcopy(result), False
+    task = _INFLIGHT.get(key)
+    if task is not None:
+        logger.debug("Joining in-flight LLM call for %s", key[0])
+        return copy.deepcopy(await asyncio.shield(task)), False
+    task = asyncio.ensure_future(fetch())
+    _INFLIGHT[key] = task
+    task.add_done_callback(lambda done: _settle(key, done, keep))
+    return copy.deepcopy(await asyncio.shield(task)), True
+
+def has_tickets(update: dict) -> bool:
+    return update["parsed_tickets"] is not None
+
+# --- LLM STEPS ---
+# Each runs one LLM step through the cache. Drafting steps return the parsed
+# state update, so only drafts that parsed and validated get cached.
+
+async def analyze_spec(spec: str) -> str:
+    async def fetch() -> str:
+        prompt = ANALYZE_TMPL.format(spec_text=spec)
+        return (await call_llm(get_gemini(), [HumanMessage(content=prompt)])).content
+
+    analysis, _ = await cached(("analyze", digest(spec)), fetch, keep=bool)
+    return analysis
+
+async def draft_tickets(spec: str, analysis: str, echo: bool = False) -> dict:
+    async def fetch() -> dict:
+        prompt = DRAFT_TMPL.format(spec_text=spec, analysis=analysis)
+        return tickets_update(
+            await stream_llm(get_azure(), [HumanMessage(content=prompt)], echo=echo)
+        )
+
+    key = ("draft", digest(spec), digest(analysis))
+    update, fetched = await cached(key, fetch, keep=has_tickets)
+    if echo and not fetched:
+        print(update["jira_tickets"])
+    return update
+
+async def analyze_and_draft(spec: str, echo: bool = False) -> dict:
+    async def fetch() -> dict:
+        prompt = ANALYZE_AND_DRAFT_TMPL.format(spec_text=spec)
+        return analyze_and_draft_update(
+            await stream_llm(get_azure(), [HumanMessage(content=prompt)], echo=echo)
+        )
+
+    update, fetched = await cached(("analyze_and_draft", digest(spec)), fetch, keep=has_tickets)
+    if echo and not fetched:
+        print(update["jira_tickets"])
+    return update
+
+# --- NODES (The Steps) ---
+
+async def analyze_requirements_node(state: AgentState):
+    """
+    Step 1: Use Google Gemini to analyze the spec for missing details.
+    """
+    logger.info("STEP 1: Google Gemini is analyzing the requirements...")
+    
+    # Invoke Gemini (awaited, so other specs in a batch can run meanwhile)
+    analysis = await analyze_spec(state['spec_text'])
+    
+    # Update the state with the analysis
+    return {"analysis_gaps": analysis}
+
+async def draft_tickets_node(state: AgentState, config: RunnableConfig):
+    """
+    Step 2: Use Azure OpenAI to take the analysis and write Jira tickets.
+    Pass `stream_tokens=True` in the run's configurable to echo tokens as they arrive.
+    """
+    logger.info("STEP 2: Azure OpenAI is drafting Jira tickets...")
+    
+    # Stream from Azure OpenAI so the reader sees tickets while they're generated.
+    # Batch runs leave echoing off, otherwise concurrent specs would interleave.
+    echo = config.get("configurable", {}).get("stream_tokens", False)
+    # Update the state with the final tickets, parsed here so nothing
+    # downstream has to do it again
+    return await draft_tickets(state['spec_text'], state['analysis_gaps'], echo=echo)
+
+async def analyze_and_draft_node(state: AgentState, config: RunnableConfig):
+    """
+    Steps 1+2 in one call: Azure OpenAI analyzes the spec and writes the Jira tickets.
+    Pass `stream_tokens=True` in the run's configurable to echo tokens as they arrive.
+    """
+    logger.info("STEP 1+2: Azure OpenAI is analyzing the spec and drafting Jira tickets...")
+    
+    echo = config.get("configurable", {}).get("stream_tokens", False)
+    return await analyze_and_draft(state['spec_text'], echo=echo)
 
 # --- THE GRAPH (The Architecture) ---
-# This defines the workflow: Start -> Analyze -> Draft -> End
+# By default this is a single step: Start -> Analyze & Draft -> End.
+# Set SPLIT_PROMPT=true for the original two-model chain (Start -> Analyze -> Draft -> End),
+# e.g. to A/B the output quality against the fused prompt.
+SPLIT_PROMPT = os.getenv("SPLIT_PROMPT", "false").lower() in ("1", "true", "yes")
 
 workflow = StateGraph(AgentState)
 
-# Add our nodes
-workflow.add_node("analyze_spec", analyze_requirements_node)
-workflow.add_node("create_tickets", draft_tickets_node)
+if SPLIT_PROMPT:
+    # Add our nodes
+    workflow.add_node("analyze_spec", analyze_requirements_node)
+    workflow.add_node("create_tickets", draft_tickets_node)
+
+    # Add edges (Connect the dots)
+    workflow.set_entry_point("analyze_spec") # Start here
+    workflow.add_edge("analyze_spec", "create_tickets") # Then go here
+    workflow.add_edge("create_tickets", END) # Then finish
+else:
+    workflow.add_node("analyze_and_draft", analyze_and_draft_node)
+    workflow.set_entry_point("analyze_and_draft")
+    workflow.add_edge("analyze_and_draft", END)
+
+# --- PERSISTENCE ---
+# Every step is checkpointed to SQLite, keyed by a hash of the spec. With SPLIT_PROMPT,
+# if the process dies after the (expensive) Gemini call, the next run for the same spec
+# resumes at the Azure step instead of paying for both LLM calls again.
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "spec_analyzer.sqlite")
+
+@asynccontextmanager
+async def open_app():
+    """
+    Compile the graph against the SQLite checkpointer and keep the connection open.
+    """
+    async with AsyncSqliteSaver.from_conn_string(CHECKPOINT_DB) as checkpointer:
+        yield workflow.compile(checkpointer=checkpointer)
+
+def thread_id_for(spec: str) -> str:
+    # The graph shape depends on SPLIT_PROMPT, so keep the two modes' checkpoints apart
+    mode = "split" if SPLIT_PROMPT else "fused"
+    return f"{mode}-{digest(spec).hex()}"
 
-# Add edges (Connect the dots)
-workflow.set_entry_point("analyze_spec") # Start here
-workflow.add_edge("analyze_spec", "create_tickets") # Then go here
-workflow.add_edge("create_tickets", END) # Then finish
+async def run_spec(app, spec: str, stream_tokens: bool = False) -> dict:
+    """
+    Run the graph for one spec, resuming an unfinished checkpoint if there is one.
+    """
+    config = {"configurable": {"thread_id": thread_id_for(spec), "stream_tokens": stream_tokens}}
+    snapshot = await app.aget_state(config)
+    if snapshot.next:
+        logger.info("Resuming unfinished run %s at: %s", config["configurable"]["thread_id"], snapshot.next)
+        return await app.ainvoke(None, config)
+    return await app.ainvoke({"spec_text": spec}, config)
 
-# Compile the graph into a runnable application
-app = workflow.compile()
+# --- BATCH EXECUTION ---
+# Each spec is an independent run of the graph, so we can overlap the network
+# calls to Vertex and Azure. The LLM semaphore keeps us under provider rate limits.
+async def run_specs(specs: list[str]) -> list[dict | Exception]:
+    """
+    Run the graph for every spec concurrently and return the final states in input order.
+    A spec that fails yields its exception in place of a state; the other runs carry on,
+    and the checkpointer and clients are only closed once every run has finished.
+    Duplicate specs share one run (and one checkpoint thread). Closes the shared
+    HTTP client when done, so it is safe to call under its own asyncio.run().
+    """
+    unique_specs = list(dict.fromkeys(specs))
+
+    try:
+        async with open_app() as app:
+            results = await asyncio.gather(
+                *(run_spec(app, spec) for spec in unique_specs),
+                return_exceptions=True
+            )
+    finally:
+        await close_clients()
+
+    by_spec = dict(zip(unique_specs, results))
+    return [by_spec[spec] for spec in specs]
 
 # --- MAIN EXECUTION ---
-if __name__ == "__main__":
+def print_tickets(result: dict):
+    if result['parsed_tickets'] is None:
+        # Not valid ticket JSON; show what the model actually said
+        print(result['jira_tickets'])
+    else:
+        print(orjson.dumps(result['parsed_tickets'], option=orjson.OPT_INDENT_2).decode())
+
+async def main(spec_paths: list[str]) -> int:
+    """
+    With spec files given on the command line, run them all concurrently via run_specs.
+    Otherwise run the built-in sample spec, streaming the tickets as they are drafted.
+    Returns the process exit code: 1 if any spec failed.
+    """
+    if spec_paths:
+        specs = [Path(path).read_text() for path in spec_paths]
+        results = await run_specs(specs)
+
+        failed = 0
+        for path, result in zip(spec_paths, results):
+            print(f"\n\n################ {path} ################\n")
+            if isinstance(result, Exception):
+                failed += 1
+                logger.error("Spec %s failed", path, exc_info=result)
+                print(f"FAILED: {type(result).__name__}: {result}")
+            else:
+                print_tickets(result)
+        print("\n##############################################")
+        return 1 if failed else 0
+
     # Simulate a vague requirement input (typical PO scenario)
     sample_spec = """
     We need to migrate the 'Customer Loyalty' SQL database from on-prem 
@@ -125,8 +576,21 @@ if __name__ == "__main__":
     print(f"INPUT SPEC: {sample_spec.strip()}\n")
     
     # Run the graph
-    result = app.invoke({"spec_text": sample_spec})
+    try:
+        async with open_app() as app:
+            result = await run_spec(app, sample_spec, stream_tokens=True)
+    finally:
+        await close_clients()
     
     print("\n\n################ FINAL OUTPUT ################\n")
-    print(result['jira_tickets'])
-    print("\n##############################################")
\ No newline at end of file
+    print_tickets(result)
+    print("\n##############################################")
+    return 0
+
+if __name__ == "__main__":
+    # Usage: python main.py [spec_file ...]
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(message)s"
+    )
+    sys.exit(asyncio.run(main(sys.argv[1:])))
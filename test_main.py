@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+import main
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    main._CACHE.clear()
+    main._INFLIGHT.clear()
+    yield
+    main._CACHE.clear()
+    main._INFLIGHT.clear()
+
+
+def make_fetch(results):
+    """
+    Build a fetch() that returns (or raises) the next item of `results` after a short
+    pause, so concurrent callers overlap. Returns the fetch and its call counter.
+    """
+    calls = {"count": 0}
+
+    async def fetch():
+        calls["count"] += 1
+        await asyncio.sleep(0.01)
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return fetch, calls
+
+
+def test_concurrent_callers_share_one_fetch():
+    fetch, calls = make_fetch([{"parsed_tickets": [{"Title": "a"}]}])
+
+    async def run():
+        return await asyncio.gather(
+            *(main.cached(("draft", b"k"), fetch, keep=main.has_tickets) for _ in range(5))
+        )
+
+    results = asyncio.run(run())
+
+    assert calls["count"] == 1
+    assert [fetched for _, fetched in results] == [True, False, False, False, False]
+    assert all(update == {"parsed_tickets": [{"Title": "a"}]} for update, _ in results)
+
+
+def test_failed_fetch_reaches_every_caller_and_is_not_cached():
+    fetch, calls = make_fetch([RuntimeError("boom"), {"parsed_tickets": [{"Title": "a"}]}])
+
+    async def run():
+        return await asyncio.gather(
+            *(main.cached(("draft", b"k"), fetch, keep=main.has_tickets) for _ in range(3)),
+            return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+
+    assert calls["count"] == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert not main._CACHE and not main._INFLIGHT
+
+    update, fetched = asyncio.run(main.cached(("draft", b"k"), fetch, keep=main.has_tickets))
+    assert fetched and calls["count"] == 2
+
+
+def test_bad_draft_is_not_cached():
+    fetch, calls = make_fetch([
+        {"jira_tickets": "oops", "parsed_tickets": None},
+        {"jira_tickets": "[]", "parsed_tickets": []},
+    ])
+
+    first, _ = asyncio.run(main.cached(("draft", b"k"), fetch, keep=main.has_tickets))
+    second, fetched = asyncio.run(main.cached(("draft", b"k"), fetch, keep=main.has_tickets))
+
+    assert first["parsed_tickets"] is None
+    assert fetched and second["parsed_tickets"] == []
+    assert calls["count"] == 2
+
+
+def test_callers_get_copies_of_cached_results():
+    fetch, calls = make_fetch([{"parsed_tickets": [{"Title": "a"}]}])
+
+    first, _ = asyncio.run(main.cached(("draft", b"k"), fetch, keep=main.has_tickets))
+    first["parsed_tickets"].append({"Title": "mutated"})
+    second, fetched = asyncio.run(main.cached(("draft", b"k"), fetch, keep=main.has_tickets))
+
+    assert not fetched and calls["count"] == 1
+    assert second == {"parsed_tickets": [{"Title": "a"}]}